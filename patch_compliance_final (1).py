@@ -19,12 +19,17 @@ Uses your utils.py
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from itertools import chain, repeat
+import io
 import time
+import threading
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 import plotly.graph_objects as go
-import plotly.express as px
 
 from utils import assume_role, setup_account_filter, get_account_name_by_id
 
@@ -38,12 +43,17 @@ if 'pc_data' not in st.session_state:
     st.session_state.pc_data = {
         'inst': None,
         'grp': None,
-        'pat': None
+        'pat_unique': None,
+        'scope': None
     }
 if 'pc_refresh_time' not in st.session_state:
     st.session_state.pc_refresh_time = None
 if 'pc_errors' not in st.session_state:
     st.session_state.pc_errors = []
+if 'pc_fingerprint' not in st.session_state:
+    st.session_state.pc_fingerprint = None
+if 'pc_options' not in st.session_state:
+    st.session_state.pc_options = {'accounts': (), 'regions': (), 'statuses': ()}
 
 st.title("🔧 SSM Patch Compliance Dashboard")
 
@@ -51,242 +61,785 @@ st.title("🔧 SSM Patch Compliance Dashboard")
 # AWS CLIENTS
 # ============================================================================
 
-def get_ssm(account_id, role_name, region):
-    """Get SSM client for account"""
-    try:
+# Account/region fetches are I/O bound (STS, SSM, EC2 round trips), so the GIL is not the limit
+FETCH_WORKERS = 64
+
+@st.cache_resource
+def get_executor():
+    """Worker pool shared across reruns and refreshes"""
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="patch-fetch")
+
+# Shared by every client: adaptive retries absorb throttling; clients are shared across
+# threads, so each gets as many connections as there are fetch workers. Timeouts are well
+# under botocore's 60s defaults so an unreachable endpoint fails (and retries) quickly, and
+# TCP keepalive stops idle pooled connections being dropped between fetches
+AWS_MAX_ATTEMPTS = 10
+AWS_READ_TIMEOUT = 30  # seconds
+AWS_CONFIG = Config(max_pool_connections=FETCH_WORKERS, retries={'max_attempts': AWS_MAX_ATTEMPTS, 'mode': 'adaptive'},
+                    connect_timeout=5, read_timeout=AWS_READ_TIMEOUT, tcp_keepalive=True)
+
+@st.cache_resource
+def get_stage_executor():
+    """Pool for the concurrent API stages inside one account/region fetch"""
+    return ThreadPoolExecutor(max_workers=2 * FETCH_WORKERS, thread_name_prefix="patch-stage")
+
+@st.cache_resource
+def get_credential_cache():
+    """Assumed-role credentials shared across reruns, keyed by (account_id, role_name)"""
+    return {'lock': threading.Lock(), 'creds': {}, 'key_locks': {}}
+
+@st.cache_resource
+def get_session_store():
+    """Per-thread boto3 sessions (sessions are not thread-safe), kept across reruns"""
+    return threading.local()
+
+@st.cache_resource
+def get_client_cache():
+    """boto3 clients shared across reruns, keyed by (service, account_id, role_name, region)"""
+    return {'lock': threading.Lock(), 'clients': {}}
+
+@st.cache_resource
+def get_result_cache():
+    """Per account/region fetch results shared across reruns, keyed by (worker, account_id, region, role_name)"""
+    return {'lock': threading.Lock(), 'entries': {}}
+
+# Resolved on the script thread; worker threads only touch the returned objects
+_credential_cache = get_credential_cache()
+_result_cache = get_result_cache()
+_session_store = get_session_store()
+_client_cache = get_client_cache()
+_stage_executor = get_stage_executor()
+
+def cached_credentials(key, now):
+    """Cached credentials for key, or None when missing or about to expire"""
+    with _credential_cache['lock']:
+        cached = _credential_cache['creds'].get(key)
+    # Renew a minute early so a fetch never starts with credentials about to lapse
+    if cached and cached[1] - timedelta(seconds=60) > now:
+        return cached[0]
+    return None
+
+def get_credentials(account_id, role_name):
+    """assume_role, reusing the credentials until they expire"""
+    key = (account_id, role_name)
+    now = datetime.now().astimezone()
+    creds = cached_credentials(key, now)
+    if creds:
+        return creds
+    
+    # All regions of an account start at once; let one thread assume the role
+    # while the others wait for its credentials
+    with _credential_cache['lock']:
+        key_lock = _credential_cache['key_locks'].setdefault(key, threading.Lock())
+    with key_lock:
+        creds = cached_credentials(key, now)
+        if creds:
+            return creds
         creds = assume_role(account_id, role_name)
-        if not creds:
-            return None
-        return boto3.client('ssm', region_name=region, 
-            aws_access_key_id=creds['AccessKeyId'],
-            aws_secret_access_key=creds['SecretAccessKey'],
-            aws_session_token=creds['SessionToken'])
-    except:
+        if creds:
+            expires = creds.get('Expiration')
+            if not isinstance(expires, datetime):
+                expires = now + timedelta(minutes=50)
+            with _credential_cache['lock']:
+                _credential_cache['creds'][key] = (creds, expires)
+    return creds
+
+EXPIRED_TOKEN_CODES = {'ExpiredToken', 'ExpiredTokenException', 'RequestExpired'}
+
+def drop_expired_credentials(error, account_id, role_name):
+    """Forget cached credentials AWS rejected as expired; sessions and clients rebuild from the new ones"""
+    if isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in EXPIRED_TOKEN_CODES:
+        with _credential_cache['lock']:
+            _credential_cache['creds'].pop((account_id, role_name), None)
+
+def get_session(account_id, role_name):
+    """boto3 session for this thread and account, rebuilt when the credentials rotate"""
+    creds = get_credentials(account_id, role_name)
+    if not creds:
         return None
+    sessions = getattr(_session_store, 'sessions', None)
+    if sessions is None:
+        sessions = _session_store.sessions = {}
+    key = (account_id, role_name)
+    cached = sessions.get(key)
+    if cached and cached[0] is creds:
+        return cached[1]
+    session = boto3.Session(
+        aws_access_key_id=creds['AccessKeyId'],
+        aws_secret_access_key=creds['SecretAccessKey'],
+        aws_session_token=creds['SessionToken'])
+    sessions[key] = (creds, session)
+    return session
 
-def get_ec2(account_id, role_name, region):
-    """Get EC2 client for account"""
-    try:
-        creds = assume_role(account_id, role_name)
-        if not creds:
-            return None
-        return boto3.client('ec2', region_name=region,
-            aws_access_key_id=creds['AccessKeyId'],
-            aws_secret_access_key=creds['SecretAccessKey'],
-            aws_session_token=creds['SessionToken'])
-    except:
+def get_client(service, account_id, role_name, region):
+    """Client for service in account/region, shared across threads until the credentials rotate"""
+    creds = get_credentials(account_id, role_name)
+    if not creds:
         return None
+    key = (service, account_id, role_name, region)
+    with _client_cache['lock']:
+        cached = _client_cache['clients'].get(key)
+    if cached and cached[0] is creds:
+        return cached[1]
+    # Sessions are per thread, but the clients they create are thread-safe
+    client = get_session(account_id, role_name).client(service, region_name=region, config=AWS_CONFIG)
+    with _client_cache['lock']:
+        _client_cache['clients'][key] = (creds, client)
+    return client
+
+def get_clients(account_id, role_name, region):
+    """Get (SSM, EC2) clients for account/region; (None, None) if the credentials are refused"""
+    try:
+        return (get_client('ssm', account_id, role_name, region),
+                get_client('ec2', account_id, role_name, region))
+    except (ClientError, BotoCoreError):
+        # AWS/botocore errors mean this account can't be reached (reported as auth failed);
+        # anything else propagates and is reported by run_fetch with its message
+        return None, None
 
 # ============================================================================
 # DATA COLLECTION
 # ============================================================================
 
-def fetch_account_region_data(account_id, account_name, region, role_name):
-    """Fetch patch compliance for single account/region"""
-    instances = []
+# Display/sort order, worst first; values not listed sort after these
+STATUS_ORDER = ['NON_COMPLIANT', 'UNMANAGED', 'COMPLIANT']
+SEVERITY_ORDER = ['Critical', 'High', 'Important', 'Medium', 'Moderate', 'Low', 'Informational', 'Unspecified']
+PATCH_COUNT_COLS = ['Installed Patches', 'Missing Patches', 'Failed Patches', 'Unspecified Patches']
+INSTANCE_COLS = ['Account Name', 'Region', 'Instance ID', 'Instance Name', 'Platform', 'Compliance Status',
+                 'SSM Agent Status', 'Instance State', 'Launch Time', 'Managed'] + PATCH_COUNT_COLS
+# Filled per account/region in fetch_data rather than repeated in every worker row
+SCOPE_COLS = ['Account Name', 'Region']
+# Low-cardinality text columns, stored as category to save memory and speed up isin/value_counts
+INSTANCE_CATEGORY_COLS = ['Account Name', 'Region', 'Platform', 'SSM Agent Status', 'Instance State']
+PATCH_COLS = ['Patch ID', 'Title', 'Classification', 'Severity', 'Release Date', 'Content URL']
+# Column layouts of the views; the unfiltered ones are projected once per fetch
+INSTANCE_DISPLAY_COLS = ['Instance ID', 'Instance Name', 'Platform', 'Compliance Status', 'SSM Agent Status',
+                         'Missing Patches', 'Managed', 'Instance State', 'Account Name', 'Region']
+# Patch group rows from the workers, as tuples; Account Name and Region are added in fetch_data
+GROUP_ROW_COLS = ['Patch Group', 'Baseline ID', 'Instances Count', 'Compliant', 'Non-Compliant', 'Unspecified']
+GROUP_DISPLAY_COLS = GROUP_ROW_COLS + ['Account Name', 'Region']
+GROUP_CATEGORY_COLS = ['Baseline ID', 'Account Name', 'Region']
+PATCH_DISPLAY_COLS = ['Patch ID', 'Title', 'Classification', 'Severity', 'Release Date']
+MISSING_DISPLAY_COLS = ['Instance ID', 'Instance Name', 'Account Name', 'Region', 'Missing Patches']
+PATCH_STATE_BATCH = 50  # describe_instance_patch_states accepts at most 50 InstanceIds
+
+def list_instances(ec2):
+    """EC2 instances in the region, keyed by instance ID"""
+    instance_map = {}
+    paginator = ec2.get_paginator('describe_instances')
+    for page in paginator.paginate(PaginationConfig={'PageSize': 1000}):
+        for res in page.get('Reservations', []):
+            for inst in res.get('Instances', []):
+                iid = inst['InstanceId']
+                platform = inst.get('Platform', 'linux')
+                tags = {t['Key']: t['Value'] for t in inst['Tags']} if 'Tags' in inst else {}
+                instance_map[iid] = {
+                    'name': tags.get('Name', iid),
+                    'platform': platform,
+                    'state': inst['State']['Name'],
+                    'launch': inst.get('LaunchTime', None)
+                }
+    return instance_map
+
+def list_agent_status(ssm):
+    """SSM agent ping status, keyed by instance ID"""
+    agents = {}
+    paginator = ssm.get_paginator('describe_instance_information')
+    for page in paginator.paginate(PaginationConfig={'PageSize': 50}):
+        for inst in page.get('InstanceInformationList', []):
+            agents[inst['InstanceId']] = inst.get('PingStatus', 'Unknown')
+    return agents
+
+def list_patch_compliance(ssm):
+    """PATCH compliance status, keyed by resource ID"""
+    compliance = {}
+    paginator = ssm.get_paginator('list_resource_compliance_summaries')
+    for page in paginator.paginate(Filters=[{'Key': 'ComplianceType', 'Values': ['PATCH']}],
+                                   PaginationConfig={'PageSize': 50}):
+        for summary in page.get('ResourceComplianceSummaryItems', []):
+            compliance[summary.get('ResourceId', '')] = summary.get('Status', 'NON_COMPLIANT')
+    return compliance
+
+def list_patch_states(ssm, instance_ids):
+    """Patch state summaries for up to PATCH_STATE_BATCH instance IDs"""
+    states = []
+    paginator = ssm.get_paginator('describe_instance_patch_states')
+    for page in paginator.paginate(InstanceIds=instance_ids, PaginationConfig={'PageSize': 50}):
+        states.extend(page.get('InstancePatchStates', []))
+    return states
+
+PATCH_GROUP_WORKERS = 8  # concurrent describe_patch_group_state calls per account/region
+
+def list_patch_group_states(ssm, pairs):
+    """Compliance state for each (patch group, baseline) pair; returns (groups, [(group name, AWS error)])"""
     groups = []
+    failed = []
+    for group_name, baseline_id in pairs:
+        try:
+            resp = ssm.describe_patch_group_state(PatchGroup=group_name)
+        except (ClientError, BotoCoreError) as e:
+            # One group failing should not lose the rest; anything else propagates
+            failed.append((group_name, e))
+            continue
+        count = resp.get('Instances', 0)
+        compliant = resp.get('InstancesWithInstalledPatches', 0)
+        non_compliant = resp.get('InstancesWithMissingPatches', 0) + resp.get('InstancesWithFailedPatches', 0)
+        unspecified = resp.get('InstancesWithNotApplicablePatches', 0) + resp.get('InstancesWithUnreportedNotApplicablePatches', 0)
+        
+        # Collect all groups with count > 0, as GROUP_ROW_COLS tuples
+        if count > 0:
+            groups.append((group_name, baseline_id, count, compliant, non_compliant, unspecified))
+    return groups, failed
+
+def list_patch_groups(ssm):
+    """(patch group, baseline ID) pairs in listing order"""
+    pairs = []
+    paginator = ssm.get_paginator('describe_patch_groups')
+    for page in paginator.paginate(PaginationConfig={'PageSize': 100}):
+        for group in page.get('Mappings', []):
+            pairs.append((group.get('PatchGroup', 'N/A'),
+                          group.get('BaselineIdentity', {}).get('BaselineId', 'N/A')))
+    return pairs
+
+def list_available_patches(ssm):
+    """Patches available from the SSM patch catalog, as PATCH_COLS tuples"""
     patches = []
+    paginator = ssm.get_paginator('describe_available_patches')
+    for page in paginator.paginate(PaginationConfig={'PageSize': 100}):
+        for patch in page.get('Patches', []):
+            patches.append((
+                patch.get('Id', 'N/A'),
+                patch.get('Title', 'N/A'),
+                patch.get('Classification', 'N/A'),
+                patch.get('Severity', 'N/A'),
+                patch.get('ReleaseDate', None),
+                patch.get('ContentUrl', 'N/A')
+            ))
+    return patches
+
+def fetch_account_region_data(account_id, account_name, region, role_name):
+    """Fetch patch compliance for single account/region; instances come back as columns"""
     errors = []
     
-    ssm = get_ssm(account_id, role_name, region)
-    ec2 = get_ec2(account_id, role_name, region)
+    ssm, ec2 = get_clients(account_id, role_name, region)
     
     if not ssm or not ec2:
         errors.append(f"❌ {account_name}/{region}: Auth failed")
-        return instances, groups, patches, errors
+        empty = {col: [] for col in INSTANCE_COLS if col not in SCOPE_COLS}
+        empty.update({col: np.zeros(0, dtype=np.int32) for col in PATCH_COUNT_COLS})
+        return empty, [], errors
     
-    # Get all EC2 instances
-    instance_map = {}
-    try:
-        paginator = ec2.get_paginator('describe_instances')
-        for page in paginator.paginate():
-            for res in page.get('Reservations', []):
-                for inst in res.get('Instances', []):
-                    iid = inst['InstanceId']
-                    platform = inst.get('Platform', 'linux')
-                    instance_map[iid] = {
-                        'name': next((t['Value'] for t in inst.get('Tags', []) if t['Key'] == 'Name'), iid),
-                        'platform': platform,
-                        'state': inst['State']['Name'],
-                        'launch': inst.get('LaunchTime', None),
-                        'ssm_managed': False,
-                        'ssm_agent_status': 'Unknown'
-                    }
-    except Exception as e:
-        errors.append(f"⚠️ {account_name}/{region}: EC2 error - {str(e)[:50]}")
+    # The listing calls are independent, so run them concurrently and join below.
+    # Each stage: (error label, function, args, value if it fails)
+    stages = {
+        'instances': ("EC2 error", list_instances, (ec2,), {}),
+        'agents': ("SSM instances", list_agent_status, (ssm,), {}),
+        'compliance': ("Compliance summaries", list_patch_compliance, (ssm,), {}),
+        'groups': ("Patch groups", list_patch_groups, (ssm,), [])
+    }
+    futures = {name: _stage_executor.submit(fn, *args) for name, (_, fn, args, _) in stages.items()}
+    results = {}
+    for name, (label, _, _, fallback) in stages.items():
+        try:
+            results[name] = futures[name].result()
+        except Exception as e:
+            drop_expired_credentials(e, account_id, role_name)
+            errors.append(f"⚠️ {account_name}/{region}: {label} - {str(e)[:50]}")
+            results[name] = fallback
     
-    # Get SSM agent status and managed instances
-    try:
-        paginator = ssm.get_paginator('describe_instance_information')
-        for page in paginator.paginate():
-            for inst in page.get('InstanceInformationList', []):
-                iid = inst['InstanceId']
-                if iid in instance_map:
-                    instance_map[iid]['ssm_managed'] = True
-                    instance_map[iid]['ssm_agent_status'] = inst.get('PingStatus', 'Unknown')
-    except Exception as e:
-        errors.append(f"⚠️ {account_name}/{region}: SSM instances - {str(e)[:50]}")
+    instance_map = results['instances']
+    agents = results['agents']
+    compliance = results['compliance']
+    group_pairs = results['groups']
     
-    # Get compliance summaries using list_resource_compliance_summaries
-    try:
-        paginator = ssm.get_paginator('list_resource_compliance_summaries')
-        for page in paginator.paginate(Filters=[{'Key': 'ComplianceType', 'Values': ['PATCH']}]):
-            for summary in page.get('ResourceComplianceSummaryItems', []):
-                iid = summary.get('ResourceId', '')
-                if iid not in instance_map:
-                    continue
-                
-                status = summary.get('Status', 'NON_COMPLIANT')
-                
-                instances.append({
-                    'Account Name': account_name,
-                    'Region': region,
-                    'Instance ID': iid,
-                    'Instance Name': instance_map[iid]['name'],
-                    'Platform': instance_map[iid]['platform'],
-                    'Compliance Status': status,
-                    'SSM Agent Status': instance_map[iid]['ssm_agent_status'],
-                    'Instance State': instance_map[iid]['state'],
-                    'Launch Time': instance_map[iid]['launch'],
-                    'Managed': instance_map[iid]['ssm_managed']
-                })
-                instance_map[iid]['processed'] = True
-    except Exception as e:
-        errors.append(f"⚠️ {account_name}/{region}: Compliance summaries - {str(e)[:50]}")
+    # Instances with a patch compliance summary, then unmanaged ones: the
+    # complement of everything reported or known to the SSM agent
+    reported_ids = [iid for iid in compliance if iid in instance_map]
+    unmanaged_ids = sorted(instance_map.keys() - compliance.keys() - agents.keys())
     
-    # Get detailed patch states for processed instances
-    try:
-        for iid in list(instance_map.keys()):
-            if instance_map[iid].get('processed'):
-                try:
-                    patch_state = ssm.describe_instance_patch_states(InstanceIds=[iid])
-                    if patch_state.get('InstancePatchStates'):
-                        state = patch_state['InstancePatchStates'][0]
-                        
-                        # Find the corresponding instance and add patch details
-                        for inst in instances:
-                            if inst['Instance ID'] == iid:
-                                inst['Installed Patches'] = state.get('InstalledCount', 0)
-                                inst['Missing Patches'] = state.get('MissingCount', 0)
-                                inst['Failed Patches'] = state.get('FailedCount', 0)
-                                inst['Unspecified Patches'] = state.get('NotApplicableCount', 0) + state.get('UnreportedNotApplicableCount', 0)
-                                break
-                except:
-                    pass
-    except Exception as e:
-        errors.append(f"⚠️ {account_name}/{region}: Patch details - {str(e)[:50]}")
+    # Patch counts for reported instances, fetched in concurrent batches of
+    # PATCH_STATE_BATCH IDs (the API maximum) instead of one call per instance.
+    # Counts go straight into an int32 array, one row per instance (unmanaged rows stay 0)
+    row_ids = reported_ids + unmanaged_ids
+    row_pos = {iid: pos for pos, iid in enumerate(reported_ids)}
+    counts = np.zeros((len(row_ids), len(PATCH_COUNT_COLS)), dtype=np.int32)
+    batches = [reported_ids[i:i + PATCH_STATE_BATCH] for i in range(0, len(reported_ids), PATCH_STATE_BATCH)]
+    batch_futures = [_stage_executor.submit(list_patch_states, ssm, batch) for batch in batches]
     
-    # Add unmanaged instances
-    for iid, info in instance_map.items():
-        if not info.get('processed') and not info.get('ssm_managed'):
-            instances.append({
-                'Account Name': account_name,
-                'Region': region,
-                'Instance ID': iid,
-                'Instance Name': info['name'],
-                'Platform': info['platform'],
-                'Compliance Status': 'UNMANAGED',
-                'SSM Agent Status': 'Not Installed',
-                'Installed Patches': 0,
-                'Missing Patches': 0,
-                'Failed Patches': 0,
-                'Unspecified Patches': 0,
-                'Instance State': info['state'],
-                'Launch Time': info['launch'],
-                'Managed': False
-            })
+    # One describe_patch_group_state round trip per group, so overlap them in up to
+    # PATCH_GROUP_WORKERS contiguous chunks (keeping the listing order), submitted
+    # from here like the batches so no stage ever waits on the pool it runs in
+    size = max(1, -(-len(group_pairs) // PATCH_GROUP_WORKERS))
+    group_futures = [_stage_executor.submit(list_patch_group_states, ssm, group_pairs[i:i + size])
+                     for i in range(0, len(group_pairs), size)]
     
-    # Get patch groups - collect all data without filtering
-    try:
-        paginator = ssm.get_paginator('describe_patch_groups')
-        for page in paginator.paginate():
-            for group in page.get('Mappings', []):
-                group_name = group.get('PatchGroup', 'N/A')
-                baseline_id = group.get('BaselineIdentity', {}).get('BaselineId', 'N/A')
-                
-                try:
-                    resp = ssm.describe_patch_group_state(PatchGroup=group_name)
-                    count = resp.get('Instances', 0)
-                    compliant = resp.get('InstancesWithInstalledPatches', 0)
-                    non_compliant = resp.get('InstancesWithMissingPatches', 0) + resp.get('InstancesWithFailedPatches', 0)
-                    unspecified = resp.get('InstancesWithNotApplicablePatches', 0) + resp.get('InstancesWithUnreportedNotApplicablePatches', 0)
-                    
-                    # Collect all groups with count > 0
-                    if count > 0:
-                        groups.append({
-                            'Account Name': account_name,
-                            'Region': region,
-                            'Patch Group': group_name,
-                            'Baseline ID': baseline_id,
-                            'Instances Count': count,
-                            'Compliant': compliant,
-                            'Non-Compliant': non_compliant,
-                            'Unspecified': unspecified
-                        })
-                except:
-                    pass
-    except Exception as e:
-        errors.append(f"⚠️ {account_name}/{region}: Patch groups - {str(e)[:50]}")
+    for fut in as_completed(batch_futures):
+        try:
+            states = fut.result()
+        except Exception as e:
+            drop_expired_credentials(e, account_id, role_name)
+            errors.append(f"⚠️ {account_name}/{region}: Patch details - {str(e)[:50]}")
+            continue
+        for state in states:
+            pos = row_pos.get(state.get('InstanceId'))
+            if pos is not None:
+                counts[pos] = (
+                    state.get('InstalledCount', 0),
+                    state.get('MissingCount', 0),
+                    state.get('FailedCount', 0),
+                    state.get('NotApplicableCount', 0) + state.get('UnreportedNotApplicableCount', 0)
+                )
+    
+    groups = []
+    for fut in group_futures:
+        chunk_groups, failed = fut.result()
+        groups.extend(chunk_groups)
+        for group_name, e in failed:
+            drop_expired_credentials(e, account_id, role_name)
+            errors.append(f"⚠️ {account_name}/{region}: Patch group {group_name} - {str(e)[:50]}")
     
-    # Get available patches
+    # Build the rows column by column (one list per column rather than one dict per row);
+    # Account Name and Region are the same for every row and are added in fetch_data
+    info = [instance_map[iid] for iid in row_ids]
+    n_unmanaged = len(unmanaged_ids)
+    instances = {
+        'Instance ID': row_ids,
+        'Instance Name': [i['name'] for i in info],
+        'Platform': [i['platform'] for i in info],
+        'Compliance Status': [compliance[iid] for iid in reported_ids] + ['UNMANAGED'] * n_unmanaged,
+        'SSM Agent Status': [agents.get(iid, 'Unknown') for iid in reported_ids] + ['Not Installed'] * n_unmanaged,
+        'Instance State': [i['state'] for i in info],
+        'Launch Time': [i['launch'] for i in info],
+        'Managed': [iid in agents for iid in reported_ids] + [False] * n_unmanaged,
+        **{col: counts[:, k] for k, col in enumerate(PATCH_COUNT_COLS)}
+    }
+    
+    return instances, groups, errors
+
+def fetch_account_region_patches(account_id, account_name, region, role_name):
+    """Fetch the available patch catalog for single account/region"""
+    ssm, _ = get_clients(account_id, role_name, region)
+    if not ssm:
+        return [], [f"❌ {account_name}/{region}: Auth failed"]
     try:
-        paginator = ssm.get_paginator('describe_available_patches')
-        for page in paginator.paginate():
-            for patch in page.get('Patches', []):
-                patches.append({
-                    'Account Name': account_name,
-                    'Region': region,
-                    'Patch ID': patch.get('Id', 'N/A'),
-                    'Title': patch.get('Title', 'N/A'),
-                    'Classification': patch.get('Classification', 'N/A'),
-                    'Severity': patch.get('Severity', 'N/A'),
-                    'Release Date': patch.get('ReleaseDate', None),
-                    'Content URL': patch.get('ContentUrl', 'N/A')
-                })
+        return list_available_patches(ssm), []
     except Exception as e:
-        errors.append(f"⚠️ {account_name}/{region}: Patches - {str(e)[:50]}")
+        drop_expired_credentials(e, account_id, role_name)
+        return [], [f"⚠️ {account_name}/{region}: Patches - {str(e)[:50]}"]
+
+RESULT_TTL = 300  # seconds a clean account/region result is reused by Fetch Data
+RESULT_CACHE_MAX = 500  # cached account/region results kept at most
+
+def fetch_cached(worker, account_id, account_name, region, role_name, force=False):
+    """worker's result for one account/region, reused for RESULT_TTL seconds unless force"""
+    key = (worker.__name__, account_id, region, role_name)
+    now = time.monotonic()
+    if not force:
+        with _result_cache['lock']:
+            cached = _result_cache['entries'].get(key)
+            if cached and cached[0] <= now:
+                # Expired: free it now rather than keeping it until it is overwritten
+                del _result_cache['entries'][key]
+                cached = None
+        if cached:
+            return cached[1]
     
-    return instances, groups, patches, errors
+    result = worker(account_id, account_name, region, role_name)
+    # Errors come last in every worker result; partial results are never reused
+    if not result[-1]:
+        now = time.monotonic()
+        with _result_cache['lock']:
+            entries = _result_cache['entries']
+            # Drop every expired result on each insert, not only when the cache is full,
+            # so stale results (the patch catalog can be large) are not kept indefinitely
+            for stale in [k for k, (expires, _) in entries.items() if expires <= now]:
+                del entries[stale]
+            # Still full: drop the ones closest to expiry
+            while len(entries) >= RESULT_CACHE_MAX:
+                del entries[min(entries, key=lambda k: entries[k][0])]
+            entries[key] = (now + RESULT_TTL, result)
+    return result
 
-def fetch_data(account_ids, all_accounts, regions, role_name):
-    """Fetch from all accounts/regions in parallel"""
-    all_inst = []
-    all_grp = []
-    all_pat = []
-    all_err = []
+PROGRESS_INTERVAL = 0.25  # seconds between progress updates sent to the browser
+# Seconds an account/region compliance scan may run before it is reported as timed out.
+# A scan is several paginated listings plus batched patch-state calls, and any one call may
+# legitimately take up to AWS_READ_TIMEOUT on each of AWS_MAX_ATTEMPTS tries, so this only
+# catches scans that are stuck; raise it for very large or heavily throttled regions
+FETCH_TIMEOUT = 2 * AWS_MAX_ATTEMPTS * AWS_READ_TIMEOUT
+
+def run_fetch(worker, account_ids, all_accounts, regions, role_name, force=False, timeout=None):
+    """Run worker for every account/region in parallel; returns [((account_name, region), result)], errors"""
+    results = []
+    failures = []
     
     progress = st.progress(0)
     status = st.empty()
     total = len(account_ids) * len(regions)
     done = 0
     
-    with ThreadPoolExecutor(max_workers=10) as exe:
-        futures = {}
-        for aid in account_ids:
-            aname = get_account_name_by_id(aid, all_accounts)
-            for rgn in regions:
-                f = exe.submit(fetch_account_region_data, aid, aname, rgn, role_name)
-                futures[f] = (aname, rgn)
-        
-        for f in as_completed(futures):
-            aname, rgn = futures[f]
+    # Start time of each account/region, so the timeout does not count time spent queued
+    # for a fetch worker. Once started it does include any wait for _stage_executor slots
+    started = {}
+    def run_one(key, aid, aname, rgn):
+        started[key] = time.monotonic()
+        return fetch_cached(worker, aid, aname, rgn, role_name, force)
+    
+    exe = get_executor()
+    futures = {}
+    for aid in account_ids:
+        # Resolved once per account and shared by all of its regions
+        aname = get_account_name_by_id(aid, all_accounts)
+        for rgn in regions:
+            f = exe.submit(run_one, (aid, rgn), aid, aname, rgn)
+            futures[f] = ((aid, rgn), aname, rgn)
+    
+    # Each progress call is a message to the browser, so send at most one per
+    # PROGRESS_INTERVAL, plus the final one
+    last_update = 0.0
+    pending = set(futures)
+    seen_started = 0
+    idle_since = time.monotonic()
+    while pending:
+        wait_for = None
+        if timeout is not None:
+            # Wake up at the earliest deadline among the running account/regions
+            deadlines = [started[futures[f][0]] + timeout for f in pending if futures[f][0] in started]
+            wait_for = max(0.0, min(deadlines, default=idle_since + timeout) - time.monotonic())
+        finished, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for f in finished:
+            _, aname, rgn = futures[f]
             done += 1
-            status.text(f"📡 {aname}/{rgn} ({done}/{total})")
-            progress.progress(done / total)
+            now = time.monotonic()
+            if done == total or now - last_update >= PROGRESS_INTERVAL:
+                status.text(f"📡 {aname}/{rgn} ({done}/{total})")
+                progress.progress(done / total)
+                last_update = now
             
             try:
-                i, g, p, e = f.result()
-                all_inst.extend(i)
-                all_grp.extend(g)
-                all_pat.extend(p)
-                all_err.extend(e)
+                results.append(((aname, rgn), f.result()))
             except Exception as ex:
-                all_err.append(f"❌ {aname}/{rgn}: {str(ex)[:50]}")
+                failures.append(f"❌ {aname}/{rgn}: {str(ex)[:50]}")
+        if timeout is None or not pending:
+            continue
+        
+        # A throttled or hung account/region must not hold up the whole fetch: give up on
+        # it once it has run for `timeout`. Its thread finishes on its own, bounded by the
+        # client connect/read timeouts, and a late result still lands in the result cache
+        now = time.monotonic()
+        expired = {f for f in pending if now - started.get(futures[f][0], now) >= timeout}
+        for f in expired:
+            _, aname, rgn = futures[f]
+            failures.append(f"❌ {aname}/{rgn}: timed out after {timeout}s")
+        pending -= expired
+        
+        # If nothing has started or finished for `timeout`, the pool is still busy with
+        # abandoned work; report what never got to run rather than waiting on it
+        if finished or len(started) != seen_started:
+            seen_started = len(started)
+            idle_since = now
+        elif now - idle_since >= timeout and not any(futures[f][0] in started for f in pending):
+            for f in pending:
+                _, aname, rgn = futures[f]
+                if f.cancel():
+                    failures.append(f"❌ {aname}/{rgn}: not run, fetch pool busy")
+                else:
+                    failures.append(f"❌ {aname}/{rgn}: timed out after {timeout}s")
+            break
     
     progress.empty()
     status.empty()
+    return results, failures
+
+def fetch_data(account_ids, all_accounts, regions, role_name, force=False):
+    """Fetch instances and patch groups from all accounts/regions in parallel"""
+    results, failures = run_fetch(fetch_account_region_data, account_ids, all_accounts, regions, role_name, force,
+                                  timeout=FETCH_TIMEOUT)
     
-    return all_inst, all_grp, all_pat, all_err
+    # Concatenate the per-worker pieces in a single pass each, rather than growing lists per future
+    sizes = [len(r[0]['Instance ID']) for _, r in results]
+    all_inst = {
+        'Account Name': list(chain.from_iterable(repeat(aname, n) for ((aname, _), _), n in zip(results, sizes))),
+        'Region': list(chain.from_iterable(repeat(rgn, n) for ((_, rgn), _), n in zip(results, sizes)))
+    }
+    for col in INSTANCE_COLS:
+        if col in PATCH_COUNT_COLS:
+            # numpy arrays from the workers; join without boxing every count
+            all_inst[col] = np.concatenate([r[0][col] for _, r in results] or [np.zeros(0, dtype=np.int32)])
+        elif col not in SCOPE_COLS:
+            all_inst[col] = list(chain.from_iterable(r[0][col] for _, r in results))
+    # Group tuples become columns in one transpose; the scope columns are repeated as above
+    grp_rows = list(chain.from_iterable(r[1] for _, r in results))
+    grp_sizes = [len(r[1]) for _, r in results]
+    all_grp = {col: list(values) for col, values in zip(GROUP_ROW_COLS, zip(*grp_rows))} if grp_rows else {}
+    all_grp['Account Name'] = list(chain.from_iterable(repeat(aname, n) for ((aname, _), _), n in zip(results, grp_sizes)))
+    all_grp['Region'] = list(chain.from_iterable(repeat(rgn, n) for ((_, rgn), _), n in zip(results, grp_sizes)))
+    all_err = list(chain.from_iterable(r[2] for _, r in results)) + failures
+    
+    return all_inst, all_grp, all_err
+
+def fetch_patches(account_ids, all_accounts, regions, role_name, force=False):
+    """Fetch the available patch catalog once per region, in parallel across regions"""
+    # The catalog is the same for every account in a region, so ask one account per
+    # region and only move on to the next account for regions where that failed
+    all_pat = []
+    seen_ids = set()
+    failures = []
+    region_errors = {}
+    remaining = list(regions)
+    for aid in account_ids:
+        if not remaining:
+            break
+        # No timeout here: paging through a whole region's catalog can take minutes
+        results, failures = run_fetch(fetch_account_region_patches, [aid], all_accounts, remaining, role_name, force)
+        # Every region without a clean result (errors, exceptions) goes to the next account;
+        # this round's failures replace the earlier ones for the regions still remaining
+        failed = set(remaining)
+        for rgn in failed - {rgn for (_, rgn), _ in results}:
+            region_errors.pop(rgn, None)
+        for (_, rgn), (pat, err) in results:
+            if err:
+                region_errors[rgn] = err
+            else:
+                failed.discard(rgn)
+                # Regions share most of the catalog; keep the first row per Patch ID
+                for row in pat:
+                    if row[0] not in seen_ids:
+                        seen_ids.add(row[0])
+                        all_pat.append(row)
+                region_errors.pop(rgn, None)
+        remaining = [rgn for rgn in remaining if rgn in failed]
+    all_err = list(chain.from_iterable(region_errors.values())) + failures
+    return all_pat, all_err
+
+def ordered_category(series, order):
+    """Ordered categorical in the given order, keeping any unexpected values at the end"""
+    extra = sorted(set(series.dropna().unique()) - set(order))
+    return series.astype(pd.CategoricalDtype(order + extra, ordered=True))
+
+def save_patches(pat, err):
+    """Store the patch catalog (already unique by Patch ID) as a typed, sorted frame"""
+    if pat:
+        # Schema is fixed, so skip per-row column inference
+        pat_unique = pd.DataFrame.from_records(pat, columns=PATCH_COLS, nrows=len(pat))
+        pat_unique['Severity'] = ordered_category(pat_unique['Severity'], SEVERITY_ORDER)
+        pat_unique['Classification'] = pat_unique['Classification'].astype('category')
+        pat_unique['Release Date'] = pd.to_datetime(pat_unique['Release Date'], utc=True)
+        pat_unique = pat_unique.sort_values('Severity', kind='stable').reset_index(drop=True)
+    else:
+        pat_unique = pd.DataFrame()
+    st.session_state.pc_data['pat_unique'] = pat_unique[PATCH_DISPLAY_COLS] if not pat_unique.empty else pat_unique
+    st.session_state.pc_data['pat_fingerprint'] = time.time_ns()
+    st.session_state.pc_errors = st.session_state.pc_errors + err
+
+def save_results(inst, grp, err, scope):
+    """Build and store the fetch result frames; the patch catalog is loaded separately, on demand"""
+    inst_df = pd.DataFrame(inst, columns=INSTANCE_COLS, copy=False)
+    if not inst_df.empty:
+        inst_df = inst_df.astype({col: 'category' for col in INSTANCE_CATEGORY_COLS} | {'Managed': 'bool'})
+        inst_df['Compliance Status'] = ordered_category(inst_df['Compliance Status'], STATUS_ORDER)
+        # boto3 returns datetimes; convert the whole column in one vectorised call
+        inst_df['Launch Time'] = pd.to_datetime(inst_df['Launch Time'], utc=True)
+        # Worst status first; filtering keeps this order, so views need not re-sort
+        inst_df = inst_df.sort_values('Compliance Status', kind='stable', ignore_index=True)
+        missing_df = inst_df.loc[inst_df['Missing Patches'] > 0, MISSING_DISPLAY_COLS]
+        missing_df = missing_df.sort_values('Missing Patches', ascending=False, kind='stable', ignore_index=True)
+    else:
+        missing_df = pd.DataFrame()
+    if grp['Account Name']:
+        grp_df = pd.DataFrame(grp, columns=GROUP_DISPLAY_COLS)
+        grp_df = grp_df.astype({col: 'category' for col in GROUP_CATEGORY_COLS})
+    else:
+        grp_df = pd.DataFrame()
+    st.session_state.pc_data = {'inst': inst_df, 'grp': grp_df, 'missing': missing_df, 'pat_unique': None, 'scope': scope}
+    # Filter options only change with the data, so compute them here once. The category
+    # levels are already the distinct values, so no pass over the rows is needed; statuses
+    # keep the worst-first category order (minus levels with no instances)
+    if inst_df.empty:
+        st.session_state.pc_options = {'accounts': (), 'regions': (), 'statuses': ()}
+    else:
+        status = inst_df['Compliance Status'].cat
+        observed = np.bincount(status.codes.to_numpy(), minlength=len(status.categories)) > 0
+        st.session_state.pc_options = {
+            'accounts': tuple(sorted(inst_df['Account Name'].cat.categories)),
+            'regions': tuple(sorted(inst_df['Region'].cat.categories)),
+            'statuses': tuple(status.categories[observed])
+        }
+    st.session_state.pc_errors = err
+    st.session_state.pc_refresh_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # Identifies this dataset in cache keys; changes only on a new fetch
+    st.session_state.pc_fingerprint = time.time_ns()
+
+# ============================================================================
+# TABLE STYLING
+# ============================================================================
+
+MAX_PREVIEW_ROWS = 5000  # Rows sent to the browser; CSV downloads are not limited
+
+# Fixed widths so the grid doesn't measure every cell to size its columns
+COLUMN_WIDTHS = {
+    'Instance ID': 'medium', 'Instance Name': 'medium', 'Platform': 'small', 'Compliance Status': 'medium',
+    'SSM Agent Status': 'small', 'Missing Patches': 'small', 'Managed': 'small', 'Instance State': 'small',
+    'Account Name': 'medium', 'Region': 'small', 'Patch Group': 'medium', 'Baseline ID': 'medium',
+    'Instances Count': 'small', 'Compliant': 'small', 'Non-Compliant': 'small', 'Unspecified': 'small',
+    'Patch ID': 'medium', 'Title': 'large', 'Classification': 'medium', 'Severity': 'small',
+    'Release Date': 'medium'
+}
+
+def highlight_compliance(df):
+    """Per-row background CSS by compliance status"""
+    status = df['Compliance Status']
+    return np.select(
+        [status.eq('NON_COMPLIANT'), status.eq('UNMANAGED')],
+        ['background-color: #f8d7da', 'background-color: #e2e3e5'],
+        default='background-color: #d4edda'
+    )
+
+def highlight_severity(df):
+    """Per-row background CSS by patch severity"""
+    severity = df['Severity']
+    return np.select(
+        [severity.eq('Critical'), severity.eq('High'), severity.eq('Medium')],
+        ['background-color: #dc3545', 'background-color: #fd7e14', 'background-color: #ffc107'],
+        default='background-color: #d4edda'
+    )
+
+def show_table(df, highlight=None):
+    """Render a (optionally highlighted) table, capped at MAX_PREVIEW_ROWS rows"""
+    preview = df.head(MAX_PREVIEW_ROWS)
+    if len(df) > MAX_PREVIEW_ROWS:
+        st.caption(f"Showing {len(preview):,} of {len(df):,} rows - download the CSV for the full table")
+    if highlight:
+        # Row colours are computed once and broadcast to the whole table in a
+        # single axis=None call, rather than one call per row or column
+        css = highlight(preview)
+        preview = preview.style.apply(
+            lambda frame: pd.DataFrame(np.broadcast_to(css[:, None], frame.shape),
+                                       index=frame.index, columns=frame.columns),
+            axis=None
+        )
+    st.dataframe(
+        preview,
+        use_container_width=True,
+        height=500,
+        hide_index=True,
+        column_config={col: st.column_config.Column(width=COLUMN_WIDTHS[col])
+                       for col in df.columns if col in COLUMN_WIDTHS}
+    )
+
+# ============================================================================
+# AGGREGATIONS
+# ============================================================================
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def summarize_instances(fingerprint, _inst_df):
+    """Headline instance metrics, computed once per fetch"""
+    if _inst_df.empty:
+        return {'comp': 0, 'non_comp': 0, 'unmg': 0, 'total': 0, 'missing': 0}
+    # Compliance Status is categorical: count its integer codes in one bincount pass
+    status = _inst_df['Compliance Status'].cat
+    counts = np.bincount(status.codes.to_numpy(), minlength=len(status.categories))
+    status_counts = dict(zip(status.categories, counts.tolist()))
+    return {
+        'comp': status_counts.get('COMPLIANT', 0),
+        'non_comp': status_counts.get('NON_COMPLIANT', 0),
+        'unmg': int((~_inst_df['Managed'].to_numpy()).sum()),
+        'total': len(_inst_df),
+        'missing': int(_inst_df['Missing Patches'].to_numpy().sum())
+    }
+
+# cache_resource, not cache_data: cache_data would unpickle a fresh copy of the frame on
+# every hit, while the filtered frame is only ever read
+@st.cache_resource(show_spinner=False, max_entries=16)
+def filter_instances(fingerprint, acc_sel, rgn_sel, sts_sel, _inst_df):
+    """Instances matching the filter selection; reused until data or selection change.
+    A selection of None means every option is selected and that column is not scanned."""
+    if _inst_df.empty:
+        return pd.DataFrame()
+    if acc_sel is None and rgn_sel is None and sts_sel is None:
+        return _inst_df  # the default, everything selected: no mask and no copy
+    mask = np.ones(len(_inst_df), dtype=bool)
+    for col, sel in (('Account Name', acc_sel), ('Region', rgn_sel), ('Compliance Status', sts_sel)):
+        if sel is not None:
+            # Categorical isin compares integer codes, not strings
+            mask &= _inst_df[col].isin(sel).to_numpy()
+    return _inst_df[mask]
+
+def selection_key(selected, options):
+    """Hashable filter selection, None when it covers all options.
+    Sorted, so picking the same options in a different order hits the same cache entry."""
+    return None if set(selected) >= set(options) else tuple(sorted(selected))
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def instance_view(key, _filtered):
+    """Instances table columns for one data + filter selection, projected once and then reused"""
+    return _filtered[INSTANCE_DISPLAY_COLS].reset_index(drop=True)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def summarize_filtered(key, _filtered):
+    """Chart inputs for the filtered instances, computed once per data + filter selection"""
+    if _filtered.empty:
+        return {'missing': 0, 'failed': 0, 'accounts': (), 'platforms': ()}
+    return {
+        'missing': int((_filtered['Missing Patches'].to_numpy() > 0).sum()),
+        'failed': int((_filtered['Failed Patches'].to_numpy() > 0).sum()),
+        'accounts': count_items(_filtered['Account Name'].value_counts()),
+        'platforms': count_items(_filtered['Platform'].value_counts())
+    }
+
+# ============================================================================
+# CHARTS
+# ============================================================================
+
+MAX_CHART_ITEMS = 30  # bars per chart; the smallest beyond this are summed into "Other"
+
+def count_items(counts, limit=MAX_CHART_ITEMS):
+    """Hashable ((label, count), ...) tuple from a counts Series, converted in bulk"""
+    counts = counts[counts > 0]  # categorical value_counts also lists unobserved categories
+    if len(counts) > limit:
+        # Keep the account and platform bar charts bounded however many values there are
+        counts = counts.sort_values(ascending=False, kind='stable')
+        other = int(counts.iloc[limit - 1:].sum())
+        counts = counts.iloc[:limit - 1]
+        return tuple(zip(counts.index.tolist(), counts.tolist())) + (('Other', other),)
+    return tuple(zip(counts.index.tolist(), counts.tolist()))
+
+# Charts get uirevision=revision, a key of the data and filters: reruns keep the chart's
+# zoom/legend state, and a new fetch or filter change resets it
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def pie_fig(title, items, colors, revision, hole=0.3):
+    """Donut chart for (label, value) items; rebuilt only when the counts or revision change"""
+    labels, values = zip(*items) if items else ((), ())
+    fig = go.Figure(data=[go.Pie(
+        labels=labels,
+        values=values,
+        marker=dict(colors=list(colors)),
+        hole=hole
+    )], layout=dict(title_text=title, height=400, showlegend=True, uirevision=revision))
+    return fig
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def bar_fig(title, x_title, items, color, revision):
+    """Bar chart for (label, value) items; rebuilt only when the counts or revision change"""
+    labels, values = zip(*items) if items else ((), ())
+    fig = go.Figure(data=[go.Bar(
+        x=labels,
+        y=values,
+        marker_color=color
+    )], layout=dict(title_text=title, xaxis_title=x_title, yaxis_title="Count", height=400, uirevision=revision))
+    return fig
+
+# ============================================================================
+# CSV EXPORT
+# ============================================================================
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def to_csv_bytes(key, _df):
+    """Encode a table as CSV once per key (data refresh + filters), not every rerun"""
+    # Written straight to a bytes buffer, skipping the intermediate str and its encoded copy
+    buffer = io.BytesIO()
+    _df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
 
 # ============================================================================
 # SIDEBAR - setup_account_filter handles button internally
@@ -313,10 +866,8 @@ if st.session_state.get('pc_fetch_clicked', False):
     else:
         start = time.time()
         with st.spinner("🔍 Scanning patch compliance..."):
-            inst, grp, pat, err = fetch_data(account_ids, all_accounts, regions, "readonly-role")
-            st.session_state.pc_data = {'inst': inst, 'grp': grp, 'pat': pat}
-            st.session_state.pc_errors = err
-            st.session_state.pc_refresh_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            inst, grp, err = fetch_data(account_ids, all_accounts, regions, "readonly-role")
+            save_results(inst, grp, err, (tuple(account_ids), tuple(regions)))
         elapsed = time.time() - start
         st.success(f"✅ Patch compliance data fetched in {elapsed:.2f}s")
         if err:
@@ -334,15 +885,16 @@ if debug_mode and st.session_state.pc_errors:
         for error in st.session_state.pc_errors:
             st.write(error)
 
-if st.session_state.pc_data['inst'] is None:
-    st.info("👈 Select accounts and regions, then click 'Fetch Data' button in sidebar")
-else:
+@st.fragment
+def render_dashboard():
+    """Metrics, filters, charts and views; their widgets rerun only this function, not the page"""
     data = st.session_state.pc_data
-    inst_df = pd.DataFrame(data['inst']) if data['inst'] else pd.DataFrame()
-    grp_df = pd.DataFrame(data['grp']) if data['grp'] else pd.DataFrame()
-    pat_df = pd.DataFrame(data['pat']) if data['pat'] else pd.DataFrame()
+    # Frames are built once per fetch in save_results; reruns only read them
+    inst_df = data['inst']
+    grp_df = data['grp']
+    unique_patches = data.get('pat_unique')
     
-    if inst_df.empty and grp_df.empty and pat_df.empty:
+    if inst_df.empty and grp_df.empty:
         st.warning("⚠️ No patch compliance data found.")
     else:
         # Refresh button
@@ -354,10 +906,9 @@ else:
             if st.button("🔁 Refresh", type="secondary", use_container_width=True):
                 start = time.time()
                 with st.spinner("🔍 Refreshing..."):
-                    inst, grp, pat, err = fetch_data(account_ids, all_accounts, regions, "readonly-role")
-                    st.session_state.pc_data = {'inst': inst, 'grp': grp, 'pat': pat}
-                    st.session_state.pc_errors = err
-                    st.session_state.pc_refresh_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    # Refresh always goes to AWS; Fetch Data may reuse recent results
+                    inst, grp, err = fetch_data(account_ids, all_accounts, regions, "readonly-role", force=True)
+                    save_results(inst, grp, err, (tuple(account_ids), tuple(regions)))
                 elapsed = time.time() - start
                 st.success(f"✅ Refreshed in {elapsed:.2f}s")
                 if err:
@@ -371,11 +922,13 @@ else:
         # ===== METRICS =====
         st.subheader("📊 Summary")
         
-        comp = len(inst_df[inst_df['Compliance Status'] == 'COMPLIANT']) if not inst_df.empty else 0
-        non_comp = len(inst_df[inst_df['Compliance Status'] == 'NON_COMPLIANT']) if not inst_df.empty else 0
-        unmg = len(inst_df[inst_df['Managed'] == False]) if not inst_df.empty else 0
-        total = len(inst_df)
-        total_missing = int(inst_df['Missing Patches'].sum()) if 'Missing Patches' in inst_df.columns and not inst_df.empty else 0
+        fingerprint = st.session_state.pc_fingerprint
+        metrics = summarize_instances(fingerprint, inst_df)
+        comp = metrics['comp']
+        non_comp = metrics['non_comp']
+        unmg = metrics['unmg']
+        total = metrics['total']
+        total_missing = metrics['missing']
         
         m1, m2, m3, m4, m5 = st.columns(5)
         with m1:
@@ -394,128 +947,116 @@ else:
         st.markdown("---")
         
         # ===== FILTERS =====
-        st.subheader("🔍 Filters")
-        f1, f2, f3 = st.columns(3)
-        
-        with f1:
-            acc_opts = sorted(inst_df['Account Name'].unique()) if not inst_df.empty else []
-            acc_sel = st.multiselect("Account:", acc_opts, default=acc_opts, key="patch_account")
-        
-        with f2:
-            rgn_opts = sorted(inst_df['Region'].unique()) if not inst_df.empty else []
-            rgn_sel = st.multiselect("Region:", rgn_opts, default=rgn_opts, key="patch_region")
-        
-        with f3:
-            sts_opts = sorted(inst_df['Compliance Status'].unique()) if not inst_df.empty else []
-            sts_sel = st.multiselect("Compliance Status:", sts_opts, default=sts_opts, key="patch_status")
-        
-        filtered = inst_df[(inst_df['Account Name'].isin(acc_sel)) & 
-                           (inst_df['Region'].isin(rgn_sel)) & 
-                           (inst_df['Compliance Status'].isin(sts_sel))] if not inst_df.empty else pd.DataFrame()
-        
-        st.markdown("---")
+        # Without instances there is nothing to filter, so no filter widgets are built
+        sel_keys = (None, None, None)
+        if inst_df.empty:
+            filtered = inst_df
+        else:
+            st.subheader("🔍 Filters")
+            f1, f2, f3 = st.columns(3)
+            
+            with f1:
+                acc_opts = st.session_state.pc_options['accounts']
+                acc_sel = st.multiselect("Account:", acc_opts, default=acc_opts, key="patch_account")
+            
+            with f2:
+                rgn_opts = st.session_state.pc_options['regions']
+                rgn_sel = st.multiselect("Region:", rgn_opts, default=rgn_opts, key="patch_region")
+            
+            with f3:
+                sts_opts = st.session_state.pc_options['statuses']
+                sts_sel = st.multiselect("Compliance Status:", sts_opts, default=sts_opts, key="patch_status")
+            
+            sel_keys = (selection_key(acc_sel, acc_opts), selection_key(rgn_sel, rgn_opts), selection_key(sts_sel, sts_opts))
+            filtered = filter_instances(fingerprint, *sel_keys, inst_df)
+            
+            st.markdown("---")
         
         # ===== CHARTS =====
         st.subheader("📈 Overview")
+        # Persisted via its key; when off, no chart data or figures are prepared
+        show_charts = st.toggle("Show charts", value=True, key="patch_show_charts")
         
-        c1, c2, c3 = st.columns(3)
-        
-        # Managed vs Unmanaged
-        with c1:
-            mng = total - unmg
-            mng_data = [mng, unmg]
-            mng_labs = ['Managed by SSM', 'Unmanaged']
-            mng_cols = ['#28a745', '#dc3545']
-            fig = go.Figure(data=[go.Pie(labels=mng_labs, values=mng_data, marker=dict(colors=mng_cols), hole=0.3)])
-            fig.update_layout(title_text="Instance Management Status", height=400, showlegend=True)
-            st.plotly_chart(fig, use_container_width=True)
-        
-        # Compliance Summary
-        with c2:
-            comp_data = [comp, non_comp, unmg]
-            comp_labs = ['Compliant', 'Non-Compliant', 'Unmanaged']
-            comp_cols = ['#28a745', '#dc3545', '#6c757d']
-            comp_data_flt = [v for v, l in zip(comp_data, comp_labs) if v > 0]
-            comp_labs_flt = [l for v, l in zip(comp_data, comp_labs) if v > 0]
-            comp_cols_flt = [c for v, c in zip(comp_data, comp_cols) if v > 0]
-            fig = go.Figure(data=[go.Pie(labels=comp_labs_flt, values=comp_data_flt, marker=dict(colors=comp_cols_flt), hole=0.3)])
-            fig.update_layout(title_text="Compliance Summary", height=400, showlegend=True)
-            st.plotly_chart(fig, use_container_width=True)
-        
-        # Non-compliance reasons
-        with c3:
-            if not filtered.empty and 'Missing Patches' in filtered.columns:
-                miss_cnt = len(filtered[filtered['Missing Patches'] > 0])
-                fail_cnt = len(filtered[filtered['Failed Patches'] > 0]) if 'Failed Patches' in filtered.columns else 0
-                if miss_cnt > 0 or fail_cnt > 0:
-                    nc_data = []
-                    nc_labs = []
-                    nc_cols = []
-                    if miss_cnt > 0:
-                        nc_data.append(miss_cnt)
-                        nc_labs.append('Missing Patches')
-                        nc_cols.append('#fd7e14')
-                    if fail_cnt > 0:
-                        nc_data.append(fail_cnt)
-                        nc_labs.append('Failed Patches')
-                        nc_cols.append('#dc3545')
-                    fig = go.Figure(data=[go.Pie(labels=nc_labs, values=nc_data, marker=dict(colors=nc_cols), hole=0.3)])
-                    fig.update_layout(title_text="Non-Compliance Reasons", height=400, showlegend=True)
-                    st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.info("ℹ️ No non-compliance data")
-            else:
-                st.info("ℹ️ No data to display")
-        
-        st.markdown("---")
-        
-        # Additional charts
-        if not filtered.empty:
-            c1, c2 = st.columns(2)
+        if show_charts:
+            chart_counts = summarize_filtered(('chart', fingerprint) + sel_keys, filtered)
+            chart_rev = hash((fingerprint,) + sel_keys)
+            c1, c2, c3 = st.columns(3)
             
+            # Managed vs Unmanaged
             with c1:
-                acc_counts = filtered['Account Name'].value_counts()
-                fig = go.Figure(data=[go.Bar(x=acc_counts.index, y=acc_counts.values, marker_color='#ff7f0e')])
-                fig.update_layout(title_text="Instances by Account", xaxis_title="Account", yaxis_title="Count", height=400)
+                mng_items = (('Managed by SSM', total - unmg), ('Unmanaged', unmg))
+                fig = pie_fig("Instance Management Status", mng_items, ('#28a745', '#dc3545'), chart_rev)
                 st.plotly_chart(fig, use_container_width=True)
             
+            # Compliance Summary
             with c2:
-                plt_counts = filtered['Platform'].value_counts()
-                fig = go.Figure(data=[go.Bar(x=plt_counts.index, y=plt_counts.values, marker_color='#1f77b4')])
-                fig.update_layout(title_text="Instances by Platform", xaxis_title="Platform", yaxis_title="Count", height=400)
+                comp_data = [comp, non_comp, unmg]
+                comp_labs = ['Compliant', 'Non-Compliant', 'Unmanaged']
+                comp_cols = ['#28a745', '#dc3545', '#6c757d']
+                comp_items = tuple((l, v) for v, l in zip(comp_data, comp_labs) if v > 0)
+                comp_cols_flt = tuple(c for v, c in zip(comp_data, comp_cols) if v > 0)
+                fig = pie_fig("Compliance Summary", comp_items, comp_cols_flt, chart_rev)
                 st.plotly_chart(fig, use_container_width=True)
             
+            # Non-compliance reasons
+            with c3:
+                if not filtered.empty:
+                    miss_cnt = chart_counts['missing']
+                    fail_cnt = chart_counts['failed']
+                    if miss_cnt > 0 or fail_cnt > 0:
+                        nc_items = []
+                        nc_cols = []
+                        if miss_cnt > 0:
+                            nc_items.append(('Missing Patches', miss_cnt))
+                            nc_cols.append('#fd7e14')
+                        if fail_cnt > 0:
+                            nc_items.append(('Failed Patches', fail_cnt))
+                            nc_cols.append('#dc3545')
+                        fig = pie_fig("Non-Compliance Reasons", tuple(nc_items), tuple(nc_cols), chart_rev)
+                        st.plotly_chart(fig, use_container_width=True)
+                    else:
+                        st.info("ℹ️ No non-compliance data")
+                else:
+                    st.info("ℹ️ No data to display")
+            
             st.markdown("---")
+            
+            # Additional charts
+            if not filtered.empty:
+                c1, c2 = st.columns(2)
+                
+                with c1:
+                    acc_items = chart_counts['accounts']
+                    st.plotly_chart(bar_fig("Instances by Account", "Account", acc_items, '#ff7f0e', chart_rev), use_container_width=True)
+                
+                with c2:
+                    plt_items = chart_counts['platforms']
+                    st.plotly_chart(bar_fig("Instances by Platform", "Platform", plt_items, '#1f77b4', chart_rev), use_container_width=True)
+                
+                st.markdown("---")
         
-        # ===== TABS =====
-        tab1, tab2, tab3, tab4 = st.tabs(["🖥️ Instances", "📋 Patch Groups", "🔵 Available Patches", "📊 Missing Patches"])
+        # ===== VIEWS =====
+        # Only the selected view is executed on each rerun (st.tabs runs every body)
+        view = st.radio(
+            "View:",
+            ["🖥️ Instances", "📋 Patch Groups", "🔵 Available Patches", "📊 Missing Patches"],
+            horizontal=True,
+            key="patch_tab",
+            label_visibility="collapsed"
+        )
         
-        with tab1:
+        if view == "🖥️ Instances":
             st.subheader("Instance Patch Compliance Report")
             
             if not filtered.empty:
-                display_cols = ['Instance ID', 'Instance Name', 'Platform', 'Compliance Status', 'SSM Agent Status', 'Managed', 'Instance State', 'Account Name', 'Region']
-                if 'Missing Patches' in filtered.columns:
-                    display_cols.insert(5, 'Missing Patches')
-                display_df = filtered[display_cols].sort_values('Compliance Status').reset_index(drop=True)
+                display_df = instance_view(('inst', fingerprint) + sel_keys, filtered)
                 
-                def highlight_compliance(row):
-                    status = row['Compliance Status']
-                    if status == 'NON_COMPLIANT':
-                        return ['background-color: #f8d7da'] * len(row)
-                    elif status == 'UNMANAGED':
-                        return ['background-color: #e2e3e5'] * len(row)
-                    else:
-                        return ['background-color: #d4edda'] * len(row)
+                show_table(display_df, highlight_compliance)
                 
-                st.dataframe(
-                    display_df.style.apply(highlight_compliance, axis=1),
-                    use_container_width=True,
-                    height=500,
-                    hide_index=True
+                csv = to_csv_bytes(
+                    ('inst', fingerprint) + sel_keys + (len(display_df),),
+                    display_df
                 )
-                
-                csv = display_df.to_csv(index=False)
                 st.download_button(
                     label="📥 Download Instances CSV",
                     data=csv,
@@ -525,21 +1066,15 @@ else:
             else:
                 st.info("ℹ️ No instance data available.")
         
-        with tab2:
+        elif view == "📋 Patch Groups":
             st.subheader("Patch Groups Compliance Summary")
             
             if not grp_df.empty:
-                display_cols = ['Patch Group', 'Baseline ID', 'Instances Count', 'Compliant', 'Non-Compliant', 'Unspecified', 'Account Name', 'Region']
-                display_df = grp_df[display_cols].reset_index(drop=True)
+                display_df = grp_df
                 
-                st.dataframe(
-                    display_df,
-                    use_container_width=True,
-                    height=500,
-                    hide_index=True
-                )
+                show_table(display_df)
                 
-                csv = display_df.to_csv(index=False)
+                csv = to_csv_bytes(('grp', fingerprint, len(display_df)), display_df)
                 st.download_button(
                     label="📥 Download Patch Groups CSV",
                     data=csv,
@@ -549,34 +1084,32 @@ else:
             else:
                 st.info("ℹ️ No patch group data available.")
         
-        with tab3:
+        elif view == "🔵 Available Patches":
             st.subheader("Available Patches")
             
-            if not pat_df.empty:
-                unique_patches = pat_df.drop_duplicates(subset=['Patch ID']).copy()
+            # The patch catalog is large and rarely needed, so it is only fetched on request
+            if unique_patches is None:
+                st.caption("The SSM patch catalog is not part of the compliance scan.")
+                if st.button("📥 Load Available Patches", key="patch_load_catalog"):
+                    scope_accounts, scope_regions = data['scope']
+                    start = time.time()
+                    with st.spinner("🔍 Loading patch catalog..."):
+                        pat, err = fetch_patches(list(scope_accounts), all_accounts, list(scope_regions), "readonly-role")
+                        save_patches(pat, err)
+                    st.success(f"✅ Patch catalog loaded in {time.time() - start:.2f}s")
+                    if err:
+                        with st.expander(f"⚠️ Messages ({len(err)})"):
+                            for e in err:
+                                st.text(e)
+                    st.rerun()
+            elif not unique_patches.empty:
+                pat_key = ('pat', data['pat_fingerprint'])
                 
-                display_cols = ['Patch ID', 'Title', 'Classification', 'Severity', 'Release Date']
-                display_df = unique_patches[display_cols].sort_values('Severity', ascending=False).reset_index(drop=True)
+                display_df = unique_patches
                 
-                def highlight_severity(row):
-                    severity = row['Severity']
-                    if severity == 'Critical':
-                        return ['background-color: #dc3545'] * len(row)
-                    elif severity == 'High':
-                        return ['background-color: #fd7e14'] * len(row)
-                    elif severity == 'Medium':
-                        return ['background-color: #ffc107'] * len(row)
-                    else:
-                        return ['background-color: #d4edda'] * len(row)
-                
-                st.dataframe(
-                    display_df.style.apply(highlight_severity, axis=1),
-                    use_container_width=True,
-                    height=500,
-                    hide_index=True
-                )
+                show_table(display_df, highlight_severity)
                 
-                csv = display_df.to_csv(index=False)
+                csv = to_csv_bytes(pat_key + (len(display_df),), display_df)
                 st.download_button(
                     label="📥 Download Available Patches CSV",
                     data=csv,
@@ -586,24 +1119,16 @@ else:
             else:
                 st.info("ℹ️ No patch data available.")
         
-        with tab4:
+        elif view == "📊 Missing Patches":
             st.subheader("Instances with Missing Patches")
             
-            if not inst_df.empty and 'Missing Patches' in inst_df.columns:
-                missing_patches_df = inst_df[inst_df['Missing Patches'] > 0].copy()
+            if not inst_df.empty:
+                display_df = data['missing']
                 
-                if not missing_patches_df.empty:
-                    display_cols = ['Instance ID', 'Instance Name', 'Account Name', 'Region', 'Missing Patches']
-                    display_df = missing_patches_df[display_cols].sort_values('Missing Patches', ascending=False).reset_index(drop=True)
-                    
-                    st.dataframe(
-                        display_df,
-                        use_container_width=True,
-                        height=500,
-                        hide_index=True
-                    )
+                if not display_df.empty:
+                    show_table(display_df)
                     
-                    csv = display_df.to_csv(index=False)
+                    csv = to_csv_bytes(('miss', fingerprint, len(display_df)), display_df)
                     st.download_button(
                         label="📥 Download Missing Patches CSV",
                         data=csv,
@@ -614,3 +1139,8 @@ else:
                     st.success("✅ All instances are fully patched!")
             else:
                 st.info("ℹ️ No instance data available.")
+
+if st.session_state.pc_data['inst'] is None:
+    st.info("👈 Select accounts and regions, then click 'Fetch Data' button in sidebar")
+else:
+    render_dashboard()
@@ -31,7 +31,7 @@ COMMON_REGIONS = [
 @st.cache_data(ttl=3600)  # Cache for 1 hour
 def fetch_all_accounts_in_ou_tree(ou_id):
     """
-    Recursively fetch all accounts in an OU and all child OUs.
+    Fetch all accounts in an OU and all child OUs.
     Handles nested OU structure:
     
     Org2 OU
@@ -60,37 +60,31 @@ def fetch_all_accounts_in_ou_tree(ou_id):
         org_client = boto3.client('organizations', region_name='us-east-1')
         all_accounts = set()
         
-        def traverse_ou(parent_id):
-            """
-            Recursively traverse OUs and collect accounts
+        # Walk the OU tree with an explicit stack instead of recursion
+        pending = [ou_id]
+        account_paginator = org_client.get_paginator('list_accounts_for_parent')
+        child_paginator = org_client.get_paginator('list_organizational_units_for_parent')
+        
+        while pending:
+            parent_id = pending.pop()
             
-            Args:
-                parent_id (str): Parent ID to traverse (OU or Root)
-            """
             # Get all direct accounts in this OU
-            paginator = org_client.get_paginator('list_accounts_for_parent')
             try:
-                for page in paginator.paginate(ParentId=parent_id):
+                for page in account_paginator.paginate(ParentId=parent_id):
                     for account in page.get('Accounts', []):
                         all_accounts.add(account['Id'])
             except ClientError as e:
                 # If this fails, continue to next parent
                 pass
             
-            # Get all child OUs and recurse
+            # Queue all child OUs for traversal
             try:
-                child_paginator = org_client.get_paginator('list_organizational_units_for_parent')
                 for page in child_paginator.paginate(ParentId=parent_id):
-                    for child_ou in page.get('OrganizationalUnits', []):
-                        # Recursively traverse this child OU
-                        traverse_ou(child_ou['Id'])
+                    pending.extend(child_ou['Id'] for child_ou in page.get('OrganizationalUnits', []))
             except ClientError as e:
                 # If this fails, continue
                 pass
         
-        # Start traversal from the given OU ID
-        traverse_ou(ou_id)
-        
         return all_accounts
         
     except ClientError as e: